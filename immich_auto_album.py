@@ -1,21 +1,26 @@
 
 """Python script for creating albums in Immich from folder names in an external library."""
 
-from typing import Tuple
+from typing import Iterator, Tuple
 import argparse
 import logging
 import sys
 import fnmatch
 import os
 import datetime
-from collections import defaultdict, OrderedDict
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
 import re
 import random
-from urllib.error import HTTPError
 import yaml
 
 import urllib3
 import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError
 
 # Script Constants
 
@@ -31,11 +36,20 @@ SCRIPT_MODE_DELETE_ALL = "DELETE_ALL"
 ENV_IS_DOCKER = "IS_DOCKER"
 
 # List of allowed share user roles
-SHARE_ROLES = ["editor", "viewer"]
+SHARE_ROLES = frozenset(["editor", "viewer"])
 
 # Immich API request timeout
 REQUEST_TIMEOUT_DEFAULT = 20
 
+# Maximum number of independent API requests to perform concurrently
+MAX_CONCURRENT_REQUESTS = 8
+# Number of retries for idempotent API requests failing due to connection errors, rate limiting or temporary server errors
+MAX_REQUEST_RETRIES = 3
+# Maximum number of seconds to wait for the asynchronous Offline Asset Removal job in Immich prior v1.116.0
+OFFLINE_ASSET_REMOVAL_TIMEOUT = 600
+# Maximum number of seconds between two polls of the Offline Asset Removal job's status
+OFFLINE_ASSET_REMOVAL_MAX_POLL_INTERVAL = 30
+
 # Constants for album thumbnail setting
 ALBUM_THUMBNAIL_RANDOM_ALL = "random-all"
 ALBUM_THUMBNAIL_RANDOM_FILTERED = "random-filtered"
@@ -49,6 +63,9 @@ ALBUM_THUMBNAIL_STATIC_INDICES = {
 # File name to use for album properties files
 ALBUMPROPS_FILE_NAME = '.albumprops'
 
+# Valid album levels are either a single level or a range of levels like '<startLevel>,<endLevel>'
+ALBUM_LEVELS_PATTERN = re.compile(r'\s*([+-]?\d+)\s*(?:,\s*([+-]?\d+)\s*)?')
+
 class AlbumMergeException(Exception):
     """Error thrown when trying to override an existing property"""
 
@@ -99,11 +116,8 @@ class AlbumModel:
         ---------
             A dictionary of all album properties
         """
-        props = dict(vars(self))
-        for prop in list(props.keys()):
-            if prop not in AlbumModel.ALBUM_PROPERTIES_VARIABLES:
-                del props[prop]
-        return props
+        own_attribs = vars(self)
+        return {prop: own_attribs[prop] for prop in AlbumModel.ALBUM_PROPERTIES_VARIABLES}
 
     def __str__(self) -> str:
         """
@@ -147,14 +161,10 @@ class AlbumModel:
         """
         if not isinstance(other, AlbumModel):
             return False
-        incompatible_props = []
-        props = self.get_album_properties_dict()
-        other_props = other.get_album_properties_dict()
-        for prop in props:
-            if props[prop] != other_props[prop]:
-                incompatible_props.append(f'{prop}: {props[prop]} vs {other_props[prop]}')
-
-        return incompatible_props
+        own_attribs = vars(self)
+        other_attribs = vars(other)
+        return [f'{prop}: {own_attribs[prop]} vs {other_attribs[prop]}'
+                for prop in AlbumModel.ALBUM_PROPERTIES_VARIABLES if own_attribs[prop] != other_attribs[prop]]
 
     def merge_from(self, other, merge_mode: int):
         """ 
@@ -269,6 +279,8 @@ def find_albumprops_files(paths: list[str]) -> list[str]:
 def identify_root_path(path: str, root_path_list: list[str]) -> str:
     """
     Identifies which root path is the parent of the provided path.
+    If root paths are nested, root_path_list must be sorted by length, longest first
+    to identify the most specific root path.
     
     :param path: The path to find the root path for
     :type path: str
@@ -278,7 +290,7 @@ def identify_root_path(path: str, root_path_list: list[str]) -> str:
     :rtype: str
     """
     for root_path in root_path_list:
-        if root_path in path:
+        if path.startswith(root_path):
             return root_path
     return None
 
@@ -304,23 +316,25 @@ def build_album_properties_templates() -> dict:
     album_props_templates = {}
     album_name_to_album_properties_file_path = {}
     for album_properties_file_path in album_properties_file_paths:
-        # First check global path_filter and ignore options
-        if is_path_ignored(album_properties_file_path):
-            continue
-
         # Identify the root path
         album_props_root_path = identify_root_path(album_properties_file_path, root_paths)
         if not album_props_root_path:
             continue
 
-        # Chunks of the asset's path below root_path
-        path_chunks = album_properties_file_path.replace(album_props_root_path, '').split('/')
-        # A single chunk means it's just the image file in no sub folder, ignore
-        if len(path_chunks) == 1:
+        # The album properties file's path below root_path, used for both path checks and album name
+        album_properties_relative_path = album_properties_file_path[len(album_props_root_path):]
+        # First check global path_filter and ignore options
+        if is_relative_path_ignored(album_properties_relative_path, album_properties_file_path):
+            continue
+
+        # The asset's folder path below root_path, without the file name
+        folder_path = album_properties_relative_path.rpartition('/')[0]
+        # No folder means it's just the image file in no sub folder, ignore
+        if not folder_path:
             continue
 
-        # remove last item from path chunks, which is the file name
-        del path_chunks[-1]
+        # Chunks of the asset's folder path below root_path
+        path_chunks = folder_path.split('/')
         album_name = create_album_name(path_chunks, album_level_separator)
 
         try:
@@ -422,26 +436,6 @@ def check_for_and_log_incompatible_properties(model1: AlbumModel, model2: AlbumM
         return True
     return False
 
-def is_integer(string_to_test: str) -> bool:
-    """ 
-    Trying to deal with python's isnumeric() function
-    not recognizing negative numbers, tests whether the provided 
-    string is an integer or not.
-
-    Parameters
-    ----------
-        string_to_test : str
-            The string to test for integer
-    Returns
-    ---------
-        True if string_to_test is an integer, otherwise False
-    """
-    try:
-        int(string_to_test)
-        return True
-    except ValueError:
-        return False
-
 # Translation of GLOB-style patterns to Regex
 # Source: https://stackoverflow.com/a/63212852
 # FIXME_EVENTUALLY: Replace with glob.translate() introduced with Python 3.13
@@ -460,12 +454,19 @@ escaped_glob_tokens_to_re = OrderedDict((
     ('\\]', ']'),
 ))
 
-escaped_glob_replacement = re.compile('(%s)' % '|'.join(escaped_glob_tokens_to_re).replace('\\', '\\\\\\'))
+# Characters turning an ignore or path filter expression into a GLOB-style pattern
+GLOB_SPECIAL_CHARACTERS = ('/', '*', '?', '[', ']')
 
+# Regular expression matching any of the escaped GLOB tokens, compiled once at module load.
+# The tokens are escaped GLOB characters themselves, so they must be escaped again to match them literally.
+escaped_glob_replacement = re.compile(f"({'|'.join(map(re.escape, escaped_glob_tokens_to_re))})")
+
+@lru_cache(maxsize=256)
 def glob_to_re(pattern: str) -> str:
     """ 
     Converts the provided GLOB pattern to
     a regular expression.
+    Results are cached, so a pattern is only translated once.
 
     Parameters
     ----------
@@ -511,7 +512,7 @@ def read_api_key_from_file(file_path: str) -> str:
     try:
         return read_file(file_path)
     except FileNotFoundError:
-        logging.error("API Key file not found at %s", args["api_key"])
+        logging.error("API Key file not found at %s", file_path)
     except OSError as ex:
         logging.error("Error reading API Key file: %s", ex)
     return None
@@ -564,6 +565,45 @@ def expand_to_glob(expr: str) -> str:
         return glob_expr
     return expr
 
+def split_literals_and_patterns(expressions: list[str]) -> Tuple[re.Pattern, re.Pattern]:
+    """
+    Splits the provided ignore or path filter expressions into literals and
+    GLOB-style patterns and compiles a regular expression for each group.
+    A literal (an expression without any GLOB special characters) is expanded to a pattern
+    matching any path that contains the literal anywhere (see expand_to_glob), which is the same
+    as a plain substring search. Literals are therefore escaped and fused into a single alternation
+    to search for in a path, so a path is only scanned once for all literals.
+    All other expressions are converted to regular expressions and fused into a single compiled
+    alternation, so a path must only be matched once against all of them.
+
+    Parameters
+    ----------
+        expressions : list[str]
+            A list of literals or GLOB-style patterns, may be None
+    Returns
+    ---------
+        A tuple of the compiled regular expression to search for any of the literals and the compiled
+        regular expression fully matching any of the GLOB-style patterns. Each is None if there are no
+        such expressions.
+    """
+    literals = []
+    regular_expressions = []
+    if expressions:
+        # Skip duplicate expressions while keeping their order
+        for expression in dict.fromkeys(expressions):
+            if any(glob_character in expression for glob_character in GLOB_SPECIAL_CHARACTERS):
+                regular_expressions.append(glob_to_re(expand_to_glob(expression)))
+            else:
+                literals.append(expression)
+    # Do not compile an empty alternation, it would match everything
+    literals_regex = None
+    if len(literals) > 0:
+        literals_regex = re.compile('|'.join(map(re.escape, literals)))
+    patterns_regex = None
+    if len(regular_expressions) > 0:
+        patterns_regex = re.compile('|'.join(f'(?:{regular_expression})' for regular_expression in regular_expressions))
+    return (literals_regex, patterns_regex)
+
 def divide_chunks(full_list: list, chunk_size: int):
     """Yield successive n-sized chunks from l. """
     # looping till length l
@@ -610,7 +650,7 @@ def create_album_name(asset_path_chunks: list[str], album_separator: str) -> str
     """
 
     album_name_chunks = ()
-    logging.debug("path chunks = %s", list(asset_path_chunks))
+    logging.debug("path chunks = %s", asset_path_chunks)
     # Check which path to take: album_levels_range or album_levels
     if len(album_levels_range_arr) == 2:
         if album_levels_range_arr[0] < 0:
@@ -637,11 +677,10 @@ def create_album_name(asset_path_chunks: list[str], album_separator: str) -> str
             # create on-the-fly array with a single element taken from
             album_name_chunks = [asset_path_chunks[album_levels_start_level_capped]]
     else:
-        album_levels_int = int(album_levels)
         # either use as many path chunks as we have,
         # or the specified album levels
-        album_name_chunk_size = min(len(asset_path_chunks), abs(album_levels_int))
-        if album_levels_int < 0:
+        album_name_chunk_size = min(len(asset_path_chunks), abs(album_levels))
+        if album_levels < 0:
             album_name_chunk_size *= -1
 
         # Copy album name chunks from the path to use as album name
@@ -666,12 +705,12 @@ def fetch_server_version() -> dict:
             - patch
     """
     api_endpoint = f'{root_url}server/version'
-    r = requests.get(api_endpoint, **requests_kwargs, timeout=api_timeout)
+    r = api_session.get(api_endpoint, **requests_kwargs, timeout=api_timeout)
     # The API endpoint changed in Immich v1.118.0, if the new endpoint
     # was not found try the legacy one
     if r.status_code == 404:
         api_endpoint = f'{root_url}server-info/version'
-        r = requests.get(api_endpoint, **requests_kwargs, timeout=api_timeout)
+        r = api_session.get(api_endpoint, **requests_kwargs, timeout=api_timeout)
 
     if r.status_code == 200:
         server_version = r.json()
@@ -683,7 +722,7 @@ def fetch_server_version() -> dict:
     return server_version
 
 
-def fetch_assets(is_not_in_album: bool, find_archived: bool) -> list:
+def fetch_assets(is_not_in_album: bool, find_archived: bool) -> Iterator[dict]:
     """
     Fetches assets from the Immich API.
 
@@ -701,64 +740,87 @@ def fetch_assets(is_not_in_album: bool, find_archived: bool) -> list:
             will find archived and unarchived images
     Returns
     ---------
-        An array of asset objects
+        An iterator over asset objects, fetching further assets from the API while being consumed
     """
 
     return fetch_assets_with_options({'isNotInAlbum': is_not_in_album, 'withArchived': find_archived})
 
-def fetch_assets_with_options(search_options: dict) -> list:
+def fetch_assets_with_options(search_options: dict) -> Iterator[dict]:
     """
     Fetches assets from the Immich API using specific search options.
     The search options directly correspond to the body used for the search API request.
+    Assets are yielded page by page as they are received, so the full list of assets
+    does not need to be kept in memory.
+    The API does not report the total number of assets, so once the first page turned out to be full,
+    up to MAX_CONCURRENT_REQUESTS subsequent pages are requested ahead concurrently.
     
     Parameters
     ----------
         search_options: dict
             Dictionary containing options to pass to the search/metadata API endpoint
-    Returns
+    Yields
     ---------
-        An array of asset objects
+        Asset objects
     """
-    body = search_options
-    assets_found = []
-    # prepare request body
-
     # This API call allows a maximum page size of 1000
     number_of_assets_to_fetch_per_request_search = min(1000, number_of_assets_to_fetch_per_request)
-    body['size'] = number_of_assets_to_fetch_per_request_search
-    # Initial API call, let's fetch our first chunk
-    page = 1
-    body['page'] = str(page)
-    r = requests.post(root_url+'search/metadata', json=body, **requests_kwargs, timeout=api_timeout)
-    r.raise_for_status()
-    response_json = r.json()
-    assets_received = response_json['assets']['items']
-    logging.debug("Received %s assets with chunk %s", len(assets_received), page)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        # Initial API call, let's fetch our first chunk
+        page_futures = deque([executor.submit(fetch_assets_page, search_options, 1, number_of_assets_to_fetch_per_request_search)])
+        next_page = 2
+        while True:
+            assets_received = page_futures.popleft().result()
+            yield from assets_received
+            # If we got less than a full chunk size back, this was the last page
+            if len(assets_received) < number_of_assets_to_fetch_per_request_search:
+                # Pages requested ahead are empty, do not wait for those that have not been started yet
+                for page_future in page_futures:
+                    page_future.cancel()
+                return
+            # Keep requesting subsequent pages ahead while pages are consumed in order
+            while len(page_futures) < MAX_CONCURRENT_REQUESTS:
+                page_futures.append(executor.submit(fetch_assets_page, search_options, next_page, number_of_assets_to_fetch_per_request_search))
+                next_page += 1
+
+def fetch_assets_page(search_options: dict, page: int, page_size: int) -> list[dict]:
+    """
+    Fetches a single page of assets from the Immich API using specific search options.
 
-    assets_found = assets_found + assets_received
-    # If we got a full chunk size back, let's perfrom subsequent calls until we get less than a full chunk size
-    while len(assets_received) == number_of_assets_to_fetch_per_request_search:
-        page += 1
-        body['page'] = page
-        r = requests.post(root_url+'search/metadata', json=body, **requests_kwargs, timeout=api_timeout)
-        check_api_response(r)
-        response_json = r.json()
-        assets_received = response_json['assets']['items']
-        logging.debug("Received %s assets with chunk %s", len(assets_received), page)
-        assets_found = assets_found + assets_received
-    return assets_found
+    Parameters
+    ----------
+        search_options: dict
+            Dictionary containing options to pass to the search/metadata API endpoint
+        page: int
+            The number of the page to fetch, starting at 1
+        page_size: int
+            The number of assets per page
+    Returns
+    ---------
+        A list of asset objects, containing less than page_size assets for the last page
+    Raises
+    ----------
+        HTTPError if the API call fails
+    """
+    api_endpoint = f'{root_url}search/metadata'
+    # prepare request body, pages may be fetched concurrently, so do not modify the passed search options
+    body = dict(search_options, size=page_size, page=page)
+    r = api_session.post(api_endpoint, json=body, **requests_kwargs, timeout=api_timeout)
+    check_api_response(r)
+    assets_received = r.json()['assets']['items']
+    logging.debug("Received %s assets with chunk %s", len(assets_received), page)
+    return assets_received
 
 
 def fetch_albums():
     """Fetches albums from the Immich API"""
 
-    api_endpoint = 'albums'
+    api_endpoint = f'{root_url}albums'
 
-    r = requests.get(root_url+api_endpoint, **requests_kwargs, timeout=api_timeout)
+    r = api_session.get(api_endpoint, **requests_kwargs, timeout=api_timeout)
     check_api_response(r)
     return r.json()
 
-def fetch_album_info(album_id_for_info: str):
+def fetch_album_info(album_id_for_info: str, without_assets: bool = False):
     """
     Fetches information about a specific album
 
@@ -766,12 +828,17 @@ def fetch_album_info(album_id_for_info: str):
     ----------
         album_id_for_info : str
             The ID of the album to fetch information for
+        without_assets : bool
+            Flag indicating whether to omit the album's assets from the response.
+            Avoids transferring the full asset list if only album properties or users are needed.
 
     """
 
-    api_endpoint = f'albums/{album_id_for_info}'
+    api_endpoint = f'{root_url}albums/{album_id_for_info}'
+
+    params = {'withoutAssets': 'true'} if without_assets else None
 
-    r = requests.get(root_url+api_endpoint, **requests_kwargs, timeout=api_timeout)
+    r = api_session.get(api_endpoint, params=params, **requests_kwargs, timeout=api_timeout)
     check_api_response(r)
     return r.json()
 
@@ -792,10 +859,10 @@ def delete_album(album_delete: dict):
     ---------
         True if the album was deleted, otherwise False
     """
-    api_endpoint = 'albums'
+    api_endpoint = f"{root_url}albums/{album_delete['id']}"
 
     logging.debug("Deleting Album: Album ID = %s, Album Name = %s", album_delete['id'], album_delete['albumName'])
-    r = requests.delete(root_url+api_endpoint+'/'+album_delete['id'], **requests_kwargs, timeout=api_timeout)
+    r = api_session.delete(api_endpoint, **requests_kwargs, timeout=api_timeout)
     try:
         check_api_response(r)
         return True
@@ -822,12 +889,12 @@ def create_album(album_name_to_create: str) -> str:
         Exception if the API call failed
     """
 
-    api_endpoint = 'albums'
+    api_endpoint = f'{root_url}albums'
 
     data = {
         'albumName': album_name_to_create
     }
-    r = requests.post(root_url+api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
+    r = api_session.post(api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
     check_api_response(r)
 
     return r.json()['id']
@@ -846,32 +913,48 @@ def is_path_ignored(path_to_check: str) -> bool:
     ----------
         True if the asset must be ignored, otherwise False
     """
-    is_path_ignored_result = False
-    asset_root_path = None
-    for root_path_to_check in root_paths:
-        if root_path_to_check in path_to_check:
-            asset_root_path = root_path_to_check
-            break
+    # Nothing can be ignored if neither path filters nor ignore patterns are set
+    if not (path_filter_literals_regex or path_filter_regex or ignore_albums_literals_regex or ignore_albums_regex):
+        return False
+
+    asset_root_path = identify_root_path(path_to_check, root_paths)
     logging.debug("Identified root_path for asset %s = %s", path_to_check, asset_root_path)
-    if asset_root_path:
-        # First apply filter, if any
-        if len(path_filter_regex) > 0:
-            any_match = False
-            for path_filter_regex_entry in path_filter_regex:
-                if re.fullmatch(path_filter_regex_entry, path_to_check.replace(asset_root_path, '')):
-                    any_match = True
-            if not any_match:
-                logging.debug("Ignoring path %s due to path_filter setting!", path_to_check)
-                is_path_ignored_result = True
-        # If the asset "survived" the path filter, check if it is in the ignore_albums argument
-        if not is_path_ignored_result and len(ignore_albums_regex) > 0:
-            for ignore_albums_regex_entry in ignore_albums_regex:
-                if re.fullmatch(ignore_albums_regex_entry, path_to_check.replace(asset_root_path, '')):
-                    is_path_ignored_result = True
-                    logging.debug("Ignoring path %s due to ignore_albums setting!", path_to_check)
-                    break
-
-    return is_path_ignored_result
+    if not asset_root_path:
+        return False
+    return is_relative_path_ignored(path_to_check[len(asset_root_path):], path_to_check)
+
+def is_relative_path_ignored(asset_relative_path: str, path_to_check: str) -> bool:
+    """
+    Determines if the asset should be ignored for the purpose of this script
+    based on its path below its root path and global ignore and path_filter options.
+    Use this method instead of is_path_ignored if the root path of the asset is already known.
+
+    Parameters
+    ----------
+        asset_relative_path : str
+            The asset's path below its root path
+        path_to_check : str
+            The asset's full path, used for logging only
+    Returns 
+    ----------
+        True if the asset must be ignored, otherwise False
+    """
+    # First apply filter, if any
+    # Literals are a simple search for any of them, so evaluate them before any GLOB-style pattern
+    if path_filter_literals_regex or path_filter_regex:
+        any_match = ((path_filter_literals_regex and path_filter_literals_regex.search(asset_relative_path))
+                     or (path_filter_regex and path_filter_regex.fullmatch(asset_relative_path)))
+        if not any_match:
+            logging.debug("Ignoring path %s due to path_filter setting!", path_to_check)
+            return True
+    # If the asset "survived" the path filter, check if it is in the ignore_albums argument
+    if ignore_albums_literals_regex or ignore_albums_regex:
+        if ((ignore_albums_literals_regex and ignore_albums_literals_regex.search(asset_relative_path))
+                or (ignore_albums_regex and ignore_albums_regex.fullmatch(asset_relative_path))):
+            logging.debug("Ignoring path %s due to ignore_albums setting!", path_to_check)
+            return True
+
+    return False
 
 
 def add_assets_to_album(assets_add_album_id: str, asset_list: list[str]) -> list[str]:
@@ -895,33 +978,31 @@ def add_assets_to_album(assets_add_album_id: str, asset_list: list[str]) -> list
     ---------
         The asset UUIDs that were actually added to the album (not respecting assets that were already part of the album)
     """
-    api_endpoint = 'albums'
+    api_endpoint = f'{root_url}albums/{assets_add_album_id}/assets'
 
     # Divide our assets into chunks of number_of_images_per_request,
     # So the API can cope
-    assets_chunked = list(divide_chunks(asset_list, number_of_images_per_request))
     asset_list_added = []
-    for assets_chunk in assets_chunked:
+    for assets_chunk in divide_chunks(asset_list, number_of_images_per_request):
         data = {'ids':assets_chunk}
-        r = requests.put(root_url+api_endpoint+f'/{assets_add_album_id}/assets', json=data, **requests_kwargs, timeout=api_timeout)
+        r = api_session.put(api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
         check_api_response(r)
         response = r.json()
 
         for res in response:
-            if not res['success']:
-                if  res['error'] != 'duplicate':
-                    logging.warning("Error adding an asset to an album: %s", res['error'])
-            else:
+            if res['success']:
                 asset_list_added.append(res['id'])
+            elif res['error'] != 'duplicate':
+                logging.warning("Error adding an asset to an album: %s", res['error'])
 
     return asset_list_added
 
 def fetch_users():
     """Queries and returns all users"""
 
-    api_endpoint = 'users'
+    api_endpoint = f'{root_url}users'
 
-    r = requests.get(root_url+api_endpoint, **requests_kwargs, timeout=api_timeout)
+    r = api_session.get(api_endpoint, **requests_kwargs, timeout=api_timeout)
     check_api_response(r)
     return r.json()
 
@@ -947,11 +1028,11 @@ def update_album_shared_state(album_to_share: AlbumModel, unshare_users: bool) -
     # Parse and prepare expected share roles
     # List all share users by share role
     share_users_to_roles_expected = {}
-    for share_user in album.share_with:
+    for share_user in album_to_share.share_with:
         # Find the user by configured name or email
-        share_user_in_immich = find_user_by_name_or_email(share_user['user'], users)
+        share_user_in_immich = users_by_name_or_email.get(share_user['user'])
         if not share_user_in_immich:
-            logging.warning("User %s to share album %s with does not exist!", share_user['user'], album.get_final_name())
+            logging.warning("User %s to share album %s with does not exist!", share_user['user'], album_to_share.get_final_name())
             continue
         share_users_to_roles_expected[share_user_in_immich['id']] = share_user['role']
 
@@ -959,8 +1040,8 @@ def update_album_shared_state(album_to_share: AlbumModel, unshare_users: bool) -
     if len(share_users_to_roles_expected) == 0 and not unshare_users:
         return
 
-    # Now fetch reality
-    album_to_share_info = fetch_album_info(album_to_share.id)
+    # Now fetch reality, the album's assets are not needed for that
+    album_to_share_info = fetch_album_info(album_to_share.id, True)
     # Dict mapping a user ID to share role
     album_share_info = {}
     for share_user_actual in album_to_share_info['albumUsers']:
@@ -973,9 +1054,7 @@ def update_album_shared_state(album_to_share: AlbumModel, unshare_users: bool) -
         # Case: Album is not share with user
         if user_to_share_with not in album_share_info:
             # Gather all users to share the album with for this role
-            if not share_role_expected in share_roles_to_users_expected:
-                share_roles_to_users_expected[share_role_expected] = []
-            share_roles_to_users_expected[share_role_expected].append(user_to_share_with)
+            share_roles_to_users_expected.setdefault(share_role_expected, []).append(user_to_share_with)
 
         # Case: Album is shared, but with wrong role
         elif album_share_info[user_to_share_with] != share_role_expected:
@@ -1023,8 +1102,8 @@ def unshare_album_with_user(album_id_to_unshare: str, unshare_user_id: str):
     ----------
         HTTPError if the API call fails
     """
-    api_endpoint = f'albums/{album_id_to_unshare}/user/{unshare_user_id}'
-    r = requests.delete(root_url+api_endpoint, **requests_kwargs, timeout=api_timeout)
+    api_endpoint = f'{root_url}albums/{album_id_to_unshare}/user/{unshare_user_id}'
+    r = api_session.delete(api_endpoint, **requests_kwargs, timeout=api_timeout)
     check_api_response(r)
 
 def update_album_share_user_role(album_id_to_share: str, share_user_id: str, share_user_role: str):
@@ -1044,15 +1123,15 @@ def update_album_share_user_role(album_id_to_share: str, share_user_id: str, sha
         AssertionError if user_share_role contains an invalid value  
         HTTPError if the API call fails
     """
-    api_endpoint = f'albums/{album_id_to_share}/user/{share_user_id}'
+    api_endpoint = f'{root_url}albums/{album_id_to_share}/user/{share_user_id}'
 
-    assert share_role in SHARE_ROLES
+    assert share_user_role in SHARE_ROLES
 
     data = {
         'role': share_user_role
     }
 
-    r = requests.put(root_url+api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
+    r = api_session.put(api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
     check_api_response(r)
 
 def share_album_with_user_and_role(album_id_to_share: str, user_ids_to_share_with: list[str], user_share_role: str):
@@ -1074,9 +1153,9 @@ def share_album_with_user_and_role(album_id_to_share: str, user_ids_to_share_wit
         AssertionError if user_share_role contains an invalid value  
         HTTPError if the API call fails
     """
-    api_endpoint = f'albums/{album_id_to_share}/users'
+    api_endpoint = f'{root_url}albums/{album_id_to_share}/users'
 
-    assert share_role in SHARE_ROLES
+    assert user_share_role in SHARE_ROLES
 
     # build payload
     album_users = []
@@ -1090,7 +1169,7 @@ def share_album_with_user_and_role(album_id_to_share: str, user_ids_to_share_wit
         'albumUsers': album_users
     }
 
-    r = requests.put(root_url+api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
+    r = api_session.put(api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
     check_api_response(r)
 
 def trigger_offline_asset_removal():
@@ -1138,7 +1217,9 @@ def trigger_offline_asset_removal_sincee_minor_version_116():
 
     if len(offline_assets) > 0:
         logging.info("Deleting %s offline assets", len(offline_assets))
-        logging.debug("Deleting the following offline assets (count: %d): %s", len(offline_assets), [asset['originalPath'] for asset in offline_assets])
+        # Only build the list of paths if it is actually going to be logged
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Deleting the following offline assets (count: %d): %s", len(offline_assets), list(map(itemgetter('originalPath'), offline_assets)))
         delete_assets(offline_assets, True)
     else:
         logging.info("No offline assets found!")
@@ -1148,6 +1229,9 @@ def delete_assets(assets_to_delete: list, force: bool):
     """
     Deletes the provided assets from Immich.
 
+    If assets_to_delete is larger than number_of_images_per_request, the list is chunked
+    and one API call is performed per chunk. Chunks are deleted concurrently.
+
     Parameters
     ----------
         assets_to_delete : list
@@ -1159,15 +1243,33 @@ def delete_assets(assets_to_delete: list, force: bool):
     ----------
         HTTPException if the API call fails
     """
+    asset_ids_to_delete = list(map(itemgetter('id'), assets_to_delete))
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        list(executor.map(lambda assets_chunk: delete_assets_chunk(assets_chunk, force),
+                          divide_chunks(asset_ids_to_delete, number_of_images_per_request)))
+
+def delete_assets_chunk(asset_ids_to_delete: list[str], force: bool):
+    """
+    Deletes the provided asset IDs from Immich in a single API call.
+
+    Parameters
+    ----------
+        asset_ids_to_delete : list[str]
+            A list of asset IDs to delete
+        force: bool
+            Force flag to pass to the API call
 
-    api_endpoint = 'assets'
-    asset_ids_to_delete = [asset['id'] for asset in assets_to_delete]
+    Raises
+    ----------
+        HTTPException if the API call fails
+    """
+    api_endpoint = f'{root_url}assets'
     data = {
         'force': force,
         'ids': asset_ids_to_delete
     }
 
-    r = requests.delete(root_url+api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
+    r = api_session.delete(api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
     check_api_response(r)
 
 
@@ -1179,15 +1281,56 @@ def trigger_offline_asset_removal_pre_minor_version_116():
     Requires the script to run with an Administrator level API key.
     
     Works by fetching all libraries and triggering the Offline Asset Removal job
-    one by one.
+    one by one, then waits for the jobs to finish, so empty albums can be deleted
+    in the same run.
     
     Raises
     ----------
         HTTPError if the API call fails
     """
     libraries = fetch_libraries()
-    for library in libraries:
-        trigger_offline_asset_removal_async(library['id'])
+    # Triggering the job for different libraries are independent API calls, so perform them concurrently
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        list(executor.map(lambda library: trigger_offline_asset_removal_async(library['id']), libraries))
+    wait_for_library_jobs_pre_minor_version_116()
+
+def wait_for_library_jobs_pre_minor_version_116() -> bool:
+    """
+    Waits for the library job queue, which processes the Offline Asset Removal jobs, to become idle.
+    Only supported in Immich prior v1.116.0.
+    Requires the script to run with an Administrator level API key.
+
+    Polls the job status with exponentially increasing intervals up to OFFLINE_ASSET_REMOVAL_MAX_POLL_INTERVAL
+    seconds and gives up after OFFLINE_ASSET_REMOVAL_TIMEOUT seconds.
+
+    Returns
+    ----------
+        True if the library job queue is idle, otherwise False
+
+    Raises
+    ----------
+        HTTPError if the API call fails
+    """
+    api_endpoint = f'{root_url}jobs'
+
+    poll_interval = 1
+    wait_deadline = time.monotonic() + OFFLINE_ASSET_REMOVAL_TIMEOUT
+    while True:
+        r = api_session.get(api_endpoint, **requests_kwargs, timeout=api_timeout)
+        # Triggering the jobs already logged missing permissions
+        if r.status_code == 403:
+            return False
+        check_api_response(r)
+        library_job_counts = r.json()['library']['jobCounts']
+        if library_job_counts['active'] == 0 and library_job_counts['waiting'] == 0:
+            logging.info("Offline Asset Removal finished")
+            return True
+        if time.monotonic() + poll_interval > wait_deadline:
+            logging.warning("Offline Asset Removal did not finish within %d seconds, affected albums might only be deleted in the next run", OFFLINE_ASSET_REMOVAL_TIMEOUT)
+            return False
+        logging.debug("Waiting %d seconds for Offline Asset Removal to finish", poll_interval)
+        time.sleep(poll_interval)
+        poll_interval = min(poll_interval * 2, OFFLINE_ASSET_REMOVAL_MAX_POLL_INTERVAL)
 
 def fetch_libraries() -> list[dict]:
     """
@@ -1198,9 +1341,9 @@ def fetch_libraries() -> list[dict]:
         Exception if any API call fails
     """
 
-    api_endpoint = 'libraries'
+    api_endpoint = f'{root_url}libraries'
 
-    r = requests.get(root_url+api_endpoint, **requests_kwargs, timeout=api_timeout)
+    r = api_session.get(api_endpoint, **requests_kwargs, timeout=api_timeout)
     check_api_response(r)
     return r.json()
 
@@ -1217,9 +1360,9 @@ def trigger_offline_asset_removal_async(library_id: str):
         Exception if any API call fails
     """
 
-    api_endpoint = f'libraries/{library_id}/removeOffline'
+    api_endpoint = f'{root_url}libraries/{library_id}/removeOffline'
 
-    r = requests.post(root_url+api_endpoint, **requests_kwargs, timeout=api_timeout)
+    r = api_session.post(api_endpoint, **requests_kwargs, timeout=api_timeout)
     if r.status_code == 403:
         logging.fatal("--sync-mode 2 requires an Admin User API key!")
     else:
@@ -1240,13 +1383,42 @@ def set_album_thumb(thumbnail_album_id: str, thumbnail_asset_id: str):
     ----------
         Exception if the API call fails
     """
-    api_endpoint = f'albums/{thumbnail_album_id}'
+    api_endpoint = f'{root_url}albums/{thumbnail_album_id}'
 
     data = {"albumThumbnailAssetId": thumbnail_asset_id}
 
-    r = requests.patch(root_url+api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
+    r = api_session.patch(api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
     check_api_response(r)
 
+def update_album_properties_and_shared_state(album_to_update: AlbumModel, update_properties: bool, update_shared_state: bool):
+    """
+    Updates album properties and/or the album's shared state in Immich to match the AlbumModel.
+    An error updating the album properties is logged, and sharing is updated nevertheless.
+
+    Parameters
+    ----------
+        album_to_update : AlbumModel
+            The album model to use for updating the album
+        update_properties : bool
+            Flag indicating whether to update the album properties
+        update_shared_state : bool
+            Flag indicating whether to update the album's shared state, including unsharing
+            the album with users not in the album's share settings
+
+    Raises
+    ----------
+        HTTPError if an API call for sharing the album fails
+    """
+    if update_properties:
+        try:
+            update_album_properties(album_to_update)
+        except HTTPError as e:
+            logging.error('Error updating properties for album %s: %s', album_to_update.get_final_name(), e)
+
+    if update_shared_state:
+        # Handle album sharing
+        update_album_shared_state(album_to_update, True)
+
 def choose_thumbnail(thumbnail_setting: str, thumbnail_asset_list: list[dict]) -> str:
     """
     Tries to find an asset to use as thumbnail depending on thumbnail_setting.
@@ -1277,13 +1449,14 @@ def choose_thumbnail(thumbnail_setting: str, thumbnail_asset_list: list[dict]) -
         thumbnail_assets[:] = [asset for asset in thumbnail_assets if not is_path_ignored(asset['originalPath'])]
 
     if len(thumbnail_assets) > 0:
-        # Sort assets by creation date
-        thumbnail_assets.sort(key=lambda x: x['fileCreatedAt'])
+        # A random thumbnail does not depend on the order of assets, no need to sort
         if thumbnail_setting not in ALBUM_THUMBNAIL_STATIC_INDICES:
-            idx = random.randint(0, len(thumbnail_assets)-1)
-        else:
-            idx = ALBUM_THUMBNAIL_STATIC_INDICES[thumbnail_setting]
-        return thumbnail_assets[idx]
+            return random.choice(thumbnail_assets)
+        # Pick the oldest or newest asset by creation date without sorting all assets
+        if ALBUM_THUMBNAIL_STATIC_INDICES[thumbnail_setting] == 0:
+            return min(thumbnail_assets, key=lambda x: x['fileCreatedAt'])
+        # Search in reverse to pick the last of several newest assets, just as a stable sort would
+        return max(reversed(thumbnail_assets), key=lambda x: x['fileCreatedAt'])
 
     # Case: Invalid thumbnail_setting
     return None
@@ -1316,15 +1489,15 @@ def update_album_properties(album_to_update: AlbumModel):
             logging.info("Using asset %s as thumbnail for album %s", thumbnail_asset['originalPath'], album_to_update.get_final_name())
             data['albumThumbnailAssetId'] = thumbnail_asset['id']
         else:
-            logging.warning("Unable to determine thumbnail for setting '%s' in album %s", album.thumbnail_setting, album.get_final_name())
+            logging.warning("Unable to determine thumbnail for setting '%s' in album %s", album_to_update.thumbnail_setting, album_to_update.get_final_name())
 
     # Description
     if album_to_update.description:
-        data['description'] = album.description
+        data['description'] = album_to_update.description
 
     # Sorting Order
     if album_to_update.sort_order:
-        data['order'] = album.sort_order
+        data['order'] = album_to_update.sort_order
 
     # Comments / Likes enabled
     if album_to_update.comments_and_likes_enabled is not None:
@@ -1332,9 +1505,9 @@ def update_album_properties(album_to_update: AlbumModel):
 
     # Only update album if there is something to update
     if len(data) > 0:
-        api_endpoint = f'albums/{album_to_update.id}'
+        api_endpoint = f'{root_url}albums/{album_to_update.id}'
 
-        respnonse = requests.patch(root_url+api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
+        respnonse = api_session.patch(api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
         check_api_response(respnonse)
 
 def set_assets_archived(asset_ids_to_archive: list[str], is_archived: bool):
@@ -1352,14 +1525,14 @@ def set_assets_archived(asset_ids_to_archive: list[str], is_archived: bool):
     ----------
         Exception if the API call fails
     """
-    api_endpoint = 'assets'
+    api_endpoint = f'{root_url}assets'
 
     data = {
         "ids": asset_ids_to_archive,
         "isArchived": is_archived
     }
 
-    r = requests.put(root_url+api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
+    r = api_session.put(api_endpoint, json=data, **requests_kwargs, timeout=api_timeout)
     check_api_response(r)
 
 def check_api_response(response: requests.Response):
@@ -1381,11 +1554,11 @@ def check_api_response(response: requests.Response):
     try:
         response.raise_for_status()
     except HTTPError:
-        if response.json():
+        try:
             logging.error("Error in API call: %s", response.json())
-        else:
+        except ValueError:
             logging.error("API respsonse did not contain a payload")
-    response.raise_for_status()
+        raise
 
 def delete_all_albums(unarchive_assets: bool, force_delete: bool):
     """
@@ -1422,22 +1595,75 @@ def delete_all_albums(unarchive_assets: bool, force_delete: bool):
             print("Call with --delete-confirm to actually delete albums!")
         sys.exit(0)
 
-    deleted_album_count = 0
-    for album_to_delete in all_albums:
-        if delete_album(album_to_delete):
-             # If the archived flag is set it means we need to unarchived all images of deleted albums;
-            # In order to do so, we need to fetch all assets of the album we're going to delete
-            assets_in_deleted_album = []
-            if unarchive_assets:
-                album_to_delete_info = fetch_album_info(album_to_delete['id'])
-                assets_in_deleted_album = album_to_delete_info['assets']
-            logging.info("Deleted album %s", album_to_delete['albumName'])
-            deleted_album_count += 1
-            if len(assets_in_deleted_album) > 0 and unarchive_assets:
-                set_assets_archived([asset['id'] for asset in assets_in_deleted_album], False)
-                logging.info("Unarchived %d assets", len(assets_in_deleted_album))
+    deleted_album_count = delete_albums_and_unarchive_assets(all_albums, [unarchive_assets] * len(all_albums))
     logging.info("Deleted %d/%d albums", deleted_album_count, len(all_albums))
 
+def delete_albums_and_unarchive_assets(albums_to_delete: list[dict], unarchive_assets_per_album: list[bool]) -> int:
+    """
+    Deletes the provided albums. For each album with the unarchive_assets flag set, all archived assets
+    in the deleted album will be unarchived. Assets of all deleted albums are unarchived in a single API call.
+
+    Parameters
+    ----------
+        albums_to_delete : list[dict]
+            A list of dictionaries with the following keys:
+                - id
+                - albumName
+        unarchive_assets_per_album : list[bool]
+            Flags indicating whether to unarchive archived assets, one per album in albums_to_delete
+
+    Returns
+    ----------
+        Number of successfully deleted albums
+
+    Raises
+    ----------
+        HTTPError if the API call fails
+    """
+    # Deleting albums are independent API calls, so perform them concurrently
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        asset_ids_per_deleted_album = [asset_ids for asset_ids in executor.map(delete_album_and_fetch_asset_ids, albums_to_delete, unarchive_assets_per_album)
+                                       if asset_ids is not None]
+    # An asset may be part of several deleted albums
+    asset_ids_to_unarchive = {asset_id for asset_ids in asset_ids_per_deleted_album for asset_id in asset_ids}
+    if len(asset_ids_to_unarchive) > 0:
+        set_assets_archived(list(asset_ids_to_unarchive), False)
+        logging.info("Unarchived %d assets", len(asset_ids_to_unarchive))
+    return len(asset_ids_per_deleted_album)
+
+def delete_album_and_fetch_asset_ids(album_to_delete: dict, fetch_asset_ids: bool) -> list[str]:
+    """
+    Deletes the provided album. If fetch_asset_ids is set to true, the IDs of all assets
+    in the album are fetched before deleting it.
+
+    Parameters
+    ----------
+        album_to_delete : dict
+            Dictionary with the following keys:
+                - id
+                - albumName
+        fetch_asset_ids : bool
+            Flag indicating whether to fetch the IDs of the album's assets
+
+    Returns
+    ----------
+        The asset IDs of the deleted album (empty if fetch_asset_ids is False), or None if the album was not deleted
+
+    Raises
+    ----------
+        HTTPError if the API call fails
+    """
+    # If the archived flag is set it means we need to unarchived all images of deleted albums;
+    # In order to do so, we need to fetch all assets of the album before deleting it
+    asset_ids_in_deleted_album = []
+    if fetch_asset_ids:
+        album_to_delete_info = fetch_album_info(album_to_delete['id'])
+        asset_ids_in_deleted_album = [asset['id'] for asset in album_to_delete_info['assets']]
+    if not delete_album(album_to_delete):
+        return None
+    logging.info("Deleted album %s", album_to_delete['albumName'])
+    return asset_ids_in_deleted_album
+
 def cleanup_albums(albums_to_delete: list[AlbumModel], force_delete: bool):
     """
     Instead of creating, deletes albums in Immich if force_delete is True. Otherwise lists all albums
@@ -1472,22 +1698,9 @@ def cleanup_albums(albums_to_delete: list[AlbumModel], force_delete: bool):
         return 0
 
     # At this point force_delete is true!
-    cpt = 0
-    for album_to_delete in albums_to_delete:
-        # If the archived flag is set it means we need to unarchived all images of deleted albums;
-        # In order to do so, we need to fetch all assets of the album we're going to delete
-        assets_in_album = []
-        if album_to_delete.archive:
-            album_to_delete_info = fetch_album_info(album_to_delete.id)
-            assets_in_album = album_to_delete_info['assets']
-        if delete_album({'id': album_to_delete.id, 'albumName': album_to_delete.get_final_name()}):
-            logging.info("Deleted album %s", album_to_delete.get_final_name())
-            cpt += 1
-            # Archive flag is set, so we need to unarchive assets
-            if album_to_delete.archive and len(assets_in_album) > 0:
-                set_assets_archived([asset['id'] for asset in assets_in_album], False)
-                logging.info("Unarchived %d assets", len(assets_in_album))
-    return cpt
+    return delete_albums_and_unarchive_assets(
+        [{'id': album_to_delete.id, 'albumName': album_to_delete.get_final_name()} for album_to_delete in albums_to_delete],
+        [album_to_delete.archive for album_to_delete in albums_to_delete])
 
 
 def set_album_properties_in_model(album_model_to_update: AlbumModel):
@@ -1526,7 +1739,7 @@ def set_album_properties_in_model(album_model_to_update: AlbumModel):
     elif comments_and_likes_disabled:
         album_model_to_update.comments_and_likes_enabled = False
 
-def build_album_list(asset_list : list[dict], root_path_list : list[str], album_props_templates: dict) -> dict:
+def build_album_list(asset_list : Iterator[dict], root_path_list : list[str], album_props_templates: dict) -> dict:
     """
     Builds a list of album models, enriched with assets assigned to each album.
     Returns a dict where the key is the album name and the value is the model.
@@ -1534,8 +1747,8 @@ def build_album_list(asset_list : list[dict], root_path_list : list[str], album_
 
     Parameters
     ----------
-        asset_list : list[dict]
-            List of assets dictioniaries fetched from Immich API
+        asset_list : Iterator[dict]
+            Iterator over asset dictioniaries fetched from Immich API
         root_path_list : list[str]
             List of root paths to use for album creation
         album_props_templates: dict
@@ -1545,27 +1758,35 @@ def build_album_list(asset_list : list[dict], root_path_list : list[str], album_
     ---------
         A dict with album names as keys and an AlbumModel as value
     """
-    album_models = defaultdict(list)
-    for asset_to_add in asset_list:
+    album_models = {}
+    # All assets in the same folder get the same album name, so only create it once per folder
+    folder_path_to_album_name = {}
+    number_of_assets = 0
+    for number_of_assets, asset_to_add in enumerate(asset_list, start=1):
         asset_path = asset_to_add['originalPath']
-        # This method will log the ignore reason, so no need to log anyhting again.
-        if is_path_ignored(asset_path):
-            continue
-
         # Identify the root path
         asset_root_path = identify_root_path(asset_path, root_path_list)
         if not asset_root_path:
             continue
 
-        # Chunks of the asset's path below root_path
-        path_chunks = asset_path.replace(asset_root_path, '').split('/')
-        # A single chunk means it's just the image file in no sub folder, ignore
-        if len(path_chunks) == 1:
+        # The asset's path below root_path, used for both path checks and album name
+        asset_relative_path = asset_path[len(asset_root_path):]
+        # This method will log the ignore reason, so no need to log anyhting again.
+        if is_relative_path_ignored(asset_relative_path, asset_path):
             continue
 
-        # remove last item from path chunks, which is the file name
-        del path_chunks[-1]
-        album_name = create_album_name(path_chunks, album_level_separator)
+        # The asset's folder path below root_path, without the file name
+        folder_path = asset_relative_path.rpartition('/')[0]
+        # No folder means it's just the image file in no sub folder, ignore
+        if not folder_path:
+            continue
+
+        album_name = folder_path_to_album_name.get(folder_path)
+        if album_name is None:
+            # Chunks of the asset's folder path below root_path
+            path_chunks = folder_path.split('/')
+            album_name = create_album_name(path_chunks, album_level_separator)
+            folder_path_to_album_name[folder_path] = album_name
         if len(album_name) > 0:
             # First check if there are album properties for this album
             if album_name in album_props_templates:
@@ -1595,17 +1816,17 @@ def build_album_list(asset_list : list[dict], root_path_list : list[str], album_
             album_models[new_album_model.get_final_name()] = new_album_model
         else:
             logging.warning("Got empty album name for asset path %s, check your album_level settings!", asset_path)
+    logging.info("%d photos found", number_of_assets)
     return album_models
 
 
-def find_user_by_name_or_email(name_or_email: str, user_list: list[dict]) -> dict:
+def index_users_by_name_or_email(user_list: list[dict]) -> dict:
     """
-    Finds a user identified by name_or_email in the provided user_list.
+    Creates a lookup dictionary to find users in the provided user_list by name or email.
+    If several users share a name or email, the first one in user_list is used.
 
     Parameters
     ----------
-        name_or_email: str
-            The user name or email address to find the user by
         user_list: list[dict]
             A list of user dictioniaries with the following mandatory keys:
               - id
@@ -1613,13 +1834,14 @@ def find_user_by_name_or_email(name_or_email: str, user_list: list[dict]) -> dic
               - email
     Returns
     ---------
-        A user dict with matching name or email or None if no matching user was found
+        A dict mapping each user name and email address to the matching user dict
     """
-    for user in user_list:
-        # Search by name or mail address
-        if name_or_email in (user['name'], user['email']):
-            return user
-    return None
+    user_index = {}
+    # Iterate in reverse so that the first matching user in the list takes precedence
+    for user in reversed(user_list):
+        user_index[user['email']] = user
+        user_index[user['name']] = user
+    return user_index
 
 parser = argparse.ArgumentParser(description="Create Immich Albums from an external library path based on the top level folders",
     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -1703,312 +1925,362 @@ parser.add_argument("--update-album-props-mode", type=int, choices=[0, 1, 2], de
                             2 = Override album properties and share status, this will remove all users from the album which are not in the SHARE_WITH list.""")
 
 
-args = vars(parser.parse_args())
-# set up logger to log in logfmt format
-logging.basicConfig(level=args["log_level"], stream=sys.stdout, format='time=%(asctime)s level=%(levelname)s msg=%(message)s')
-logging.Formatter.formatTime = (lambda self, record, datefmt=None: datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).astimezone().isoformat(sep="T",timespec="milliseconds"))
-
-root_paths = args["root_path"]
-root_url = args["api_url"]
-api_key = determine_api_key(args["api_key"], args["api_key_type"])
-if api_key is None:
-    logging.fatal("Unable to determine API key with API Key type %s", args["api_key_type"])
-    sys.exit(1)
-number_of_images_per_request = args["chunk_size"]
-number_of_assets_to_fetch_per_request = args["fetch_chunk_size"]
-unattended = args["unattended"]
-album_levels = args["album_levels"]
-# Album Levels Range handling
-album_levels_range_arr = ()
-album_level_separator = args["album_separator"]
-album_order = args["album_order"]
-insecure = args["insecure"]
-ignore_albums = args["ignore"]
-mode = args["mode"]
-delete_confirm = args["delete_confirm"]
-share_with = args["share_with"]
-share_role = args["share_role"]
-sync_mode = args["sync_mode"]
-find_assets_in_albums = args["find_assets_in_albums"]
-path_filter = args["path_filter"]
-set_album_thumbnail = args["set_album_thumbnail"]
-archive = args["archive"]
-find_archived_assets = args["find_archived_assets"]
-read_album_properties = args["read_album_properties"]
-api_timeout = args["api_timeout"]
-comments_and_likes_enabled = args["comments_and_likes_enabled"]
-comments_and_likes_disabled = args["comments_and_likes_disabled"]
-if comments_and_likes_disabled and comments_and_likes_enabled:
-    logging.fatal("Arguments --comments-and-likes-enabled and --comments-and-likes-disabled cannot be used together! Choose one!")
-    sys.exit(1)
-update_album_props_mode = args["update_album_props_mode"]
-
-# Override unattended if we're running in destructive mode
-if mode != SCRIPT_MODE_CREATE:
-    # pylint: disable=C0103
-    unattended = False
-
-is_docker = os.environ.get(ENV_IS_DOCKER, False)
-
-logging.debug("root_path = %s", root_paths)
-logging.debug("root_url = %s", root_url)
-logging.debug("api_key = %s", api_key)
-logging.debug("number_of_images_per_request = %d", number_of_images_per_request)
-logging.debug("number_of_assets_to_fetch_per_request = %d", number_of_assets_to_fetch_per_request)
-logging.debug("unattended = %s", unattended)
-logging.debug("album_levels = %s", album_levels)
-#logging.debug("album_levels_range = %s", album_levels_range)
-logging.debug("album_level_separator = %s", album_level_separator)
-logging.debug("album_order = %s", album_order)
-logging.debug("insecure = %s", insecure)
-logging.debug("ignore = %s", ignore_albums)
-logging.debug("mode = %s", mode)
-logging.debug("delete_confirm = %s", delete_confirm)
-logging.debug("is_docker = %s", is_docker)
-logging.debug("share_with = %s", share_with)
-logging.debug("share_role = %s", share_role)
-logging.debug("sync_mode = %d", sync_mode)
-logging.debug("find_assets_in_albums = %s", find_assets_in_albums)
-logging.debug("path_filter = %s", path_filter)
-logging.debug("set_album_thumbnail = %s", set_album_thumbnail)
-logging.debug("archive = %s", archive)
-logging.debug("find_archived_assets = %s", find_archived_assets)
-logging.debug("read_album_properties = %s", read_album_properties)
-logging.debug("api_timeout = %s", api_timeout)
-logging.debug("comments_and_likes_enabled = %s", comments_and_likes_enabled)
-logging.debug("comments_and_likes_disabled = %s", comments_and_likes_disabled)
-logging.debug("update_album_props_mode = %d", update_album_props_mode)
-
-# Verify album levels
-if is_integer(album_levels) and album_levels == 0:
-    parser.print_help()
-    sys.exit(1)
-
-# Request arguments for API calls
-requests_kwargs = {
-    'headers' : {
+# Disable pylint for too many statements, branches and local variables as well as
+# for using the global statement, since main() sets up the global configuration used by all functions
+# pylint: disable=R0912,R0914,R0915,W0601,W0603
+def main():
+    """
+    Parses the script arguments, sets up the global configuration
+    and runs the script in the selected mode.
+    """
+    global root_paths, root_url, requests_kwargs, api_session, api_timeout, version, users_by_name_or_email
+    global number_of_images_per_request, number_of_assets_to_fetch_per_request
+    global album_levels, album_levels_range_arr, album_level_separator, album_order
+    global ignore_albums_literals_regex, ignore_albums_regex, path_filter_literals_regex, path_filter_regex, share_with, share_role, set_album_thumbnail, archive
+    global comments_and_likes_enabled, comments_and_likes_disabled, is_docker
+
+    args = vars(parser.parse_args())
+    # set up logger to log in logfmt format
+    logging.basicConfig(level=args["log_level"], stream=sys.stdout, format='time=%(asctime)s level=%(levelname)s msg=%(message)s')
+    logging.Formatter.formatTime = (lambda self, record, datefmt=None: datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).astimezone().isoformat(sep="T",timespec="milliseconds"))
+
+    root_paths = args["root_path"]
+    root_url = args["api_url"]
+    api_key = determine_api_key(args["api_key"], args["api_key_type"])
+    if api_key is None:
+        logging.fatal("Unable to determine API key with API Key type %s", args["api_key_type"])
+        sys.exit(1)
+    number_of_images_per_request = args["chunk_size"]
+    number_of_assets_to_fetch_per_request = args["fetch_chunk_size"]
+    unattended = args["unattended"]
+    album_levels = args["album_levels"]
+    # Album Levels Range handling
+    album_levels_range_arr = ()
+    album_level_separator = args["album_separator"]
+    album_order = args["album_order"]
+    insecure = args["insecure"]
+    ignore_albums = args["ignore"]
+    mode = args["mode"]
+    delete_confirm = args["delete_confirm"]
+    share_with = args["share_with"]
+    share_role = args["share_role"]
+    sync_mode = args["sync_mode"]
+    find_assets_in_albums = args["find_assets_in_albums"]
+    path_filter = args["path_filter"]
+    set_album_thumbnail = args["set_album_thumbnail"]
+    archive = args["archive"]
+    find_archived_assets = args["find_archived_assets"]
+    read_album_properties = args["read_album_properties"]
+    api_timeout = args["api_timeout"]
+    comments_and_likes_enabled = args["comments_and_likes_enabled"]
+    comments_and_likes_disabled = args["comments_and_likes_disabled"]
+    if comments_and_likes_disabled and comments_and_likes_enabled:
+        logging.fatal("Arguments --comments-and-likes-enabled and --comments-and-likes-disabled cannot be used together! Choose one!")
+        sys.exit(1)
+    update_album_props_mode = args["update_album_props_mode"]
+
+    # Override unattended if we're running in destructive mode
+    if mode != SCRIPT_MODE_CREATE:
+        unattended = False
+
+    is_docker = os.environ.get(ENV_IS_DOCKER, False)
+
+    logging.debug("root_path = %s", root_paths)
+    logging.debug("root_url = %s", root_url)
+    logging.debug("api_key = %s", api_key)
+    logging.debug("number_of_images_per_request = %d", number_of_images_per_request)
+    logging.debug("number_of_assets_to_fetch_per_request = %d", number_of_assets_to_fetch_per_request)
+    logging.debug("unattended = %s", unattended)
+    logging.debug("album_levels = %s", album_levels)
+    #logging.debug("album_levels_range = %s", album_levels_range)
+    logging.debug("album_level_separator = %s", album_level_separator)
+    logging.debug("album_order = %s", album_order)
+    logging.debug("insecure = %s", insecure)
+    logging.debug("ignore = %s", ignore_albums)
+    logging.debug("mode = %s", mode)
+    logging.debug("delete_confirm = %s", delete_confirm)
+    logging.debug("is_docker = %s", is_docker)
+    logging.debug("share_with = %s", share_with)
+    logging.debug("share_role = %s", share_role)
+    logging.debug("sync_mode = %d", sync_mode)
+    logging.debug("find_assets_in_albums = %s", find_assets_in_albums)
+    logging.debug("path_filter = %s", path_filter)
+    logging.debug("set_album_thumbnail = %s", set_album_thumbnail)
+    logging.debug("archive = %s", archive)
+    logging.debug("find_archived_assets = %s", find_archived_assets)
+    logging.debug("read_album_properties = %s", read_album_properties)
+    logging.debug("api_timeout = %s", api_timeout)
+    logging.debug("comments_and_likes_enabled = %s", comments_and_likes_enabled)
+    logging.debug("comments_and_likes_disabled = %s", comments_and_likes_disabled)
+    logging.debug("update_album_props_mode = %d", update_album_props_mode)
+
+    # Parse album levels once, either a single level or a range of levels
+    album_levels_match = ALBUM_LEVELS_PATTERN.fullmatch(album_levels)
+    is_album_levels_range = not album_levels_match or album_levels_match.group(2) is not None
+
+    # Verify album levels
+    if not is_album_levels_range:
+        album_levels = int(album_levels_match.group(1))
+        if album_levels == 0:
+            parser.print_help()
+            sys.exit(1)
+
+    # Request arguments for API calls
+    # verify must be passed with every request, since a session's verify setting is overridden
+    # by the REQUESTS_CA_BUNDLE and CURL_CA_BUNDLE environment variables
+    requests_kwargs = {
+        'verify' : not insecure
+    }
+
+    if insecure:
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    # HTTP session shared by all API calls, so connections to the Immich server
+    # are kept alive and reused instead of performing a new (TLS) handshake for every call
+    api_session = requests.Session()
+    api_session.headers.update({
         'x-api-key': api_key,
         'Content-Type': 'application/json',
         'Accept': 'application/json'
-    },
-    'verify' : not insecure
-}
-
-if insecure:
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-# Verify album levels range
-if not is_integer(album_levels):
-    album_levels_range_split = album_levels.split(",")
-    if any([
-            len(album_levels_range_split) != 2,
-            not is_integer(album_levels_range_split[0]),
-            not is_integer(album_levels_range_split[1]),
-            int(album_levels_range_split[0]) == 0,
-            int(album_levels_range_split[1]) == 0,
-            (int(album_levels_range_split[1]) < 0 >= int(album_levels_range_split[0])),
-            (int(album_levels_range_split[0]) < 0 >= int(album_levels_range_split[1])),
-            (int(album_levels_range_split[0]) < 0 and int(album_levels_range_split[1]) < 0 and int(album_levels_range_split[0]) > int(album_levels_range_split[1]))
-        ]):
-        logging.error(("Invalid album_levels range format! If a range should be set, the start level and end level must be separated by a comma like '<startLevel>,<endLevel>'. "
-                      "If negative levels are used in a range, <startLevel> must be less than or equal to <endLevel>."))
+    })
+    # Keep as many connections alive as there are concurrent API requests.
+    # Retry idempotent requests (not POST or PATCH, which could e.g. create an album twice) with exponential back-off,
+    # respecting the server's Retry-After header. The last response is returned to be handled by check_api_response.
+    api_session_retry = urllib3.util.Retry(total=MAX_REQUEST_RETRIES, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504], raise_on_status=False)
+    api_session_adapter = HTTPAdapter(pool_maxsize=MAX_CONCURRENT_REQUESTS, max_retries=api_session_retry)
+    api_session.mount('http://', api_session_adapter)
+    api_session.mount('https://', api_session_adapter)
+
+    # Verify album levels range
+    if is_album_levels_range:
+        if not album_levels_match:
+            album_levels_range_arr = None
+        else:
+            album_levels_range_arr = [int(album_levels_match.group(1)), int(album_levels_match.group(2))]
+        if album_levels_range_arr is None or any([
+                album_levels_range_arr[0] == 0,
+                album_levels_range_arr[1] == 0,
+                (album_levels_range_arr[1] < 0 >= album_levels_range_arr[0]),
+                (album_levels_range_arr[0] < 0 >= album_levels_range_arr[1]),
+                (album_levels_range_arr[1] < album_levels_range_arr[0] < 0)
+            ]):
+            logging.error(("Invalid album_levels range format! If a range should be set, the start level and end level must be separated by a comma like '<startLevel>,<endLevel>'. "
+                          "If negative levels are used in a range, <startLevel> must be less than or equal to <endLevel>."))
+            sys.exit(1)
+        # Special case: both levels are negative and end level is -1, which is equivalent to just negative album level of start level
+        if(album_levels_range_arr[0] < 0 and album_levels_range_arr[1] == -1):
+            album_levels = album_levels_range_arr[0]
+            album_levels_range_arr = ()
+            logging.debug("album_levels is a range with negative start level and end level of -1, converted to album_levels = %d", album_levels)
+        else:
+            logging.debug("valid album_levels range argument supplied")
+            logging.debug("album_levels_start_level = %d", album_levels_range_arr[0])
+            logging.debug("album_levels_end_level = %d", album_levels_range_arr[1])
+            # Deduct 1 from album start levels, since album levels start at 1 for user convenience, but arrays start at index 0
+            if album_levels_range_arr[0] > 0:
+                album_levels_range_arr[0] -= 1
+                album_levels_range_arr[1] -= 1
+
+    # Create ignore regular expressions for literals and patterns
+    ignore_albums_literals_regex, ignore_albums_regex = split_literals_and_patterns(ignore_albums)
+
+    # Create path filter regular expressions for literals and patterns
+    path_filter_literals_regex, path_filter_regex = split_literals_and_patterns(path_filter)
+
+    # append trailing slash to all root paths
+    # pylint: disable=C0200
+    for i in range(len(root_paths)):
+        if root_paths[i][-1] != '/':
+            root_paths[i] = root_paths[i] + '/'
+    # Sort root paths by length, longest first, so that for nested root paths
+    # the most specific one is identified as an asset's root path
+    root_paths.sort(key=len, reverse=True)
+    # append trailing slash to root URL
+    if root_url[-1] != '/':
+        root_url = root_url + '/'
+
+    version = fetch_server_version()
+    # Check version
+    if version['major'] == 1 and version ['minor'] < 106:
+        logging.fatal("This script only works with Immich Server v1.106.0 and newer! Update Immich Server or use script version 0.8.1!")
         sys.exit(1)
-    album_levels_range_arr = album_levels_range_split
-    # Convert to int
-    album_levels_range_arr[0] = int(album_levels_range_split[0])
-    album_levels_range_arr[1] = int(album_levels_range_split[1])
-    # Special case: both levels are negative and end level is -1, which is equivalent to just negative album level of start level
-    if(album_levels_range_arr[0] < 0 and album_levels_range_arr[1] == -1):
-        album_levels = album_levels_range_arr[0]
-        album_levels_range_arr = ()
-        logging.debug("album_levels is a range with negative start level and end level of -1, converted to album_levels = %d", album_levels)
-    else:
-        logging.debug("valid album_levels range argument supplied")
-        logging.debug("album_levels_start_level = %d", album_levels_range_arr[0])
-        logging.debug("album_levels_end_level = %d", album_levels_range_arr[1])
-        # Deduct 1 from album start levels, since album levels start at 1 for user convenience, but arrays start at index 0
-        if album_levels_range_arr[0] > 0:
-            album_levels_range_arr[0] -= 1
-            album_levels_range_arr[1] -= 1
-
-# Create ignore regular expressions
-ignore_albums_regex = []
-if ignore_albums:
-    for ignore_albums_entry in ignore_albums:
-        ignore_albums_regex.append(glob_to_re(expand_to_glob(ignore_albums_entry)))
-
-# Create path filter regular expressions
-path_filter_regex = []
-if path_filter:
-    for path_filter_entry in path_filter:
-        path_filter_regex.append(glob_to_re(expand_to_glob(path_filter_entry)))
-
-# append trailing slash to all root paths
-# pylint: disable=C0200
-for i in range(len(root_paths)):
-    if root_paths[i][-1] != '/':
-        root_paths[i] = root_paths[i] + '/'
-# append trailing slash to root URL
-if root_url[-1] != '/':
-    root_url = root_url + '/'
-
-version = fetch_server_version()
-# Check version
-if version['major'] == 1 and version ['minor'] < 106:
-    logging.fatal("This script only works with Immich Server v1.106.0 and newer! Update Immich Server or use script version 0.8.1!")
-    sys.exit(1)
-
-
-# Special case: Run Mode DELETE_ALL albums
-if mode == SCRIPT_MODE_DELETE_ALL:
-    delete_all_albums(archive, delete_confirm)
-    sys.exit(0)
-
-album_properties_templates = {}
-if read_album_properties:
-    logging.debug("Albumprops: Finding, parsing and merging %s files", ALBUMPROPS_FILE_NAME)
-    album_properties_templates = build_album_properties_templates()
-    for album_properties_path, album_properties_template in album_properties_templates.items():
-        logging.debug("Albumprops: %s -> %s", album_properties_path, album_properties_template)
-
-logging.info("Requesting all assets")
-# only request images that are not in any album if we are running in CREATE mode,
-# otherwise we need all images, even if they are part of an album
-if mode == SCRIPT_MODE_CREATE:
-    assets = fetch_assets(not find_assets_in_albums, find_archived_assets)
-else:
-    assets = fetch_assets(False, True)
-logging.info("%d photos found", len(assets))
-
-
-
-logging.info("Sorting assets to corresponding albums using folder name")
-albums_to_create = build_album_list(assets, root_paths, album_properties_templates)
-albums_to_create = dict(sorted(albums_to_create.items(), key=lambda item: item[0]))
-
-logging.info("%d albums identified", len(albums_to_create))
-logging.info("Album list: %s", list(albums_to_create.keys()))
-
-if not unattended and mode == SCRIPT_MODE_CREATE:
-    if is_docker:
-        print("Check that this is the list of albums you want to create. Run the container with environment variable UNATTENDED set to 1 to actually create these albums.")
+
+
+    # Special case: Run Mode DELETE_ALL albums
+    if mode == SCRIPT_MODE_DELETE_ALL:
+        delete_all_albums(archive, delete_confirm)
         sys.exit(0)
-    else:
-        print("Press enter to create these albums, Ctrl+C to abort")
-        input()
-
-logging.info("Listing existing albums on immich")
-
-albums = fetch_albums()
-album_to_id = {album['albumName']:album['id'] for album in albums }
-logging.info("%d existing albums identified", len(albums))
-# Set album ID for existing albums
-for album in albums_to_create.values():
-    if album.get_final_name() in album_to_id:
-        # Album already exists, just get the ID
-        album.id = album_to_id[album.get_final_name()]
-
-# mode CLEANUP
-if mode == SCRIPT_MODE_CLEANUP:
-    # Filter list of albums to create for existing albums only
-    albums_to_cleanup = {}
-    for album in albums_to_create.values():
-        # Only cleanup existing albums (has id set) and no duplicates (due to override_name)
-        if album.id and album.id not in albums_to_cleanup:
-            albums_to_cleanup[album.id] = album
-    # pylint: disable=C0103
-    number_of_deleted_albums = cleanup_albums(albums_to_cleanup.values(), delete_confirm)
-    logging.info("Deleted %d/%d albums", number_of_deleted_albums, len(albums_to_cleanup))
-    sys.exit(0)
-
-# Get all users in preparation for album sharing
-users = fetch_users()
-logging.debug("Found users: %s", users)
-
-# mode CREATE
-logging.info("Creating albums if needed")
-created_albums = []
-# List for gathering all asset UUIDs for later archiving
-asset_uuids_added = []
-for album in albums_to_create.values():
-    if not album.get_final_name() in album_to_id:
-        # Create album
-        album.id = create_album(album.get_final_name())
-        album_to_id[album.get_final_name()] = album.id
-        created_albums.append(album)
-        logging.info('Album %s added!', album.get_final_name())
-    else:
-        album.id = album_to_id[album.get_final_name()]
 
-    logging.info("Adding assets to album %s", album.get_final_name())
-    assets_added = add_assets_to_album(album.id, album.get_asset_uuids())
-    if len(assets_added) > 0:
-        asset_uuids_added += assets_added
-        logging.info("%d new assets added to %s", len(assets_added), album.get_final_name())
+    album_properties_templates = {}
+    if read_album_properties:
+        logging.debug("Albumprops: Finding, parsing and merging %s files", ALBUMPROPS_FILE_NAME)
+        album_properties_templates = build_album_properties_templates()
+        for album_properties_path, album_properties_template in album_properties_templates.items():
+            logging.debug("Albumprops: %s -> %s", album_properties_path, album_properties_template)
+
+    logging.info("Requesting all assets")
+    # only request images that are not in any album if we are running in CREATE mode,
+    # otherwise we need all images, even if they are part of an album
+    if mode == SCRIPT_MODE_CREATE:
+        assets = fetch_assets(not find_assets_in_albums, find_archived_assets)
+    else:
+        assets = fetch_assets(False, True)
+
+    # Assets are sorted into albums while they are being fetched
+    logging.info("Sorting assets to corresponding albums using folder name")
+    albums_to_create = build_album_list(assets, root_paths, album_properties_templates)
+    # Album names are unique keys, so default tuple ordering sorts by album name only
+    albums_to_create = dict(sorted(albums_to_create.items()))
+
+    logging.info("%d albums identified", len(albums_to_create))
+    logging.info("Album list: %s", list(albums_to_create.keys()))
+
+    # Without albums to create there is no need to query existing albums,
+    # unless existing albums are processed by thumbnail randomization or sync mode
+    if mode == SCRIPT_MODE_CREATE and len(albums_to_create) == 0 and set_album_thumbnail != ALBUM_THUMBNAIL_RANDOM_ALL and sync_mode == 0:
+        logging.info("No albums to create")
+        logging.info("Done!")
+        sys.exit(0)
 
-    # Update album properties depending on mode or if newly created
-    if update_album_props_mode > 0 or (album in created_albums):
-        # Update album properties
-        try:
-            update_album_properties(album)
-        except HTTPError as e:
-            logging.error('Error updating properties for album %s: %s', album.get_final_name(), e)
+    if not unattended and mode == SCRIPT_MODE_CREATE:
+        if is_docker:
+            print("Check that this is the list of albums you want to create. Run the container with environment variable UNATTENDED set to 1 to actually create these albums.")
+            sys.exit(0)
+        else:
+            print("Press enter to create these albums, Ctrl+C to abort")
+            input()
+
+    logging.info("Listing existing albums on immich")
+
+    # Fetching existing albums and users are independent API calls, so perform them concurrently.
+    # Users are only needed for album sharing in CREATE mode.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        albums_future = executor.submit(fetch_albums)
+        users_future = executor.submit(fetch_users) if mode == SCRIPT_MODE_CREATE else None
+    albums = albums_future.result()
+    album_to_id = {album['albumName']:album['id'] for album in albums }
+    logging.info("%d existing albums identified", len(albums))
+    # Set album ID for existing albums, albums to create are keyed by their final name
+    for existing_album_name in albums_to_create.keys() & album_to_id.keys():
+        albums_to_create[existing_album_name].id = album_to_id[existing_album_name]
+
+    # mode CLEANUP
+    if mode == SCRIPT_MODE_CLEANUP:
+        # Filter list of albums to create for existing albums only
+        albums_to_cleanup = {}
+        for album in albums_to_create.values():
+            # Only cleanup existing albums (has id set) and no duplicates (due to override_name)
+            if album.id and album.id not in albums_to_cleanup:
+                albums_to_cleanup[album.id] = album
+        number_of_deleted_albums = cleanup_albums(albums_to_cleanup.values(), delete_confirm)
+        logging.info("Deleted %d/%d albums", number_of_deleted_albums, len(albums_to_cleanup))
+        sys.exit(0)
 
-    # Update album sharing if needed or newly created
-    if update_album_props_mode == 2 or (album in created_albums):
-        # Handle album sharing
-        update_album_shared_state(album, True)
-
-logging.info("%d albums created", len(created_albums))
-
-# Archive assets
-if archive and len(asset_uuids_added) > 0:
-    set_assets_archived(asset_uuids_added, True)
-    logging.info("Archived %d assets", len(asset_uuids_added))
-
-# Perform album cover randomization
-if set_album_thumbnail == ALBUM_THUMBNAIL_RANDOM_ALL:
-    logging.info("Picking a new random thumbnail for all albums")
-    albums = fetch_albums()
-    for album in albums:
-        album_info = fetch_album_info(album['id'])
-        # Create album model for thumbnail randomization
-        album_model = AlbumModel(album['albumName'])
-        album_model.id = album['id']
-        album_model.assets = album_info['assets']
-        # Set thumbnail setting to 'random' in model
-        album_model.thumbnail_setting = 'random'
+    # Get all users in preparation for album sharing
+    users = users_future.result()
+    logging.debug("Found users: %s", users)
+    users_by_name_or_email = index_users_by_name_or_email(users)
+
+    # mode CREATE
+    logging.info("Creating albums if needed")
+    # Set of newly created albums, to quickly check whether an album was just created
+    created_albums = set()
+    # Creating albums are independent API calls, so perform them concurrently
+    albums_to_create_in_immich = [albums_to_create[album_name] for album_name in sorted(albums_to_create.keys() - album_to_id.keys())]
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        created_album_ids = executor.map(create_album, [album.get_final_name() for album in albums_to_create_in_immich])
+        for album, created_album_id in zip(albums_to_create_in_immich, created_album_ids):
+            album.id = created_album_id
+            album_to_id[album.get_final_name()] = album.id
+            created_albums.add(album)
+            # Keep the list of existing albums up to date so it does not need to be fetched again
+            albums.append({'id': album.id, 'albumName': album.get_final_name()})
+            logging.info('Album %s added!', album.get_final_name())
+
+    # Set for gathering all asset UUIDs for later archiving, an asset may have been added to multiple albums
+    asset_uuids_added = set()
+    # Adding assets to albums are independent API calls, so perform them concurrently.
+    # Submit each chunk of assets separately, so albums with many assets are spread across workers as well
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        assets_added_futures_per_album = [
+            [executor.submit(add_assets_to_album, album.id, assets_chunk)
+                for assets_chunk in divide_chunks(album.get_asset_uuids(), number_of_images_per_request)]
+            for album in albums_to_create.values()]
+    for album, assets_added_futures in zip(albums_to_create.values(), assets_added_futures_per_album):
+        logging.info("Added assets to album %s", album.get_final_name())
+        assets_added = [asset_uuid for assets_added_future in assets_added_futures for asset_uuid in assets_added_future.result()]
+        if len(assets_added) > 0:
+            asset_uuids_added.update(assets_added)
+            logging.info("%d new assets added to %s", len(assets_added), album.get_final_name())
+
+    # Updating properties and sharing of different albums are independent API calls, so perform them concurrently.
+    # Immich has no API to share multiple albums at once, users are already shared per album in one call per role.
+    update_all_album_props = update_album_props_mode > 0
+    update_all_album_shared_states = update_album_props_mode == 2
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        list(executor.map(lambda album: update_album_properties_and_shared_state(
+            album,
+            # Update album properties depending on mode or if newly created
+            update_all_album_props or (album in created_albums),
+            # Update album sharing if needed or newly created
+            update_all_album_shared_states or (album in created_albums)), albums_to_create.values()))
+
+    logging.info("%d albums created", len(created_albums))
+
+    # Archive assets
+    if archive and len(asset_uuids_added) > 0:
+        set_assets_archived(list(asset_uuids_added), True)
+        logging.info("Archived %d assets", len(asset_uuids_added))
+
+    # Perform album cover randomization
+    if set_album_thumbnail == ALBUM_THUMBNAIL_RANDOM_ALL:
+        logging.info("Picking a new random thumbnail for all albums")
+        # The list of albums fetched before was kept up to date with newly created albums,
+        # no need to fetch it again
+        album_models_to_randomize = []
+        for album in albums:
+            # Create album model for thumbnail randomization,
+            # the album's assets are fetched when updating album properties
+            album_model = AlbumModel(album['albumName'])
+            album_model.id = album['id']
+            # Set thumbnail setting to 'random' in model
+            album_model.thumbnail_setting = 'random'
+            album_models_to_randomize.append(album_model)
         # Update album properties (which will only pick a random thumbnail and set it, no other properties are changed)
-        update_album_properties(album_model)
-
-
-# Perform sync mode action: Trigger offline asset removal
-if sync_mode == 2:
-    logging.info("Trigger offline asset removal")
-    trigger_offline_asset_removal()
-
-# Perform sync mode action: Delete empty albums
-#
-# For Immich versions prior to v1.116.0:
-# Attention: Since Offline Asset Removal is an asynchronous job,
-# albums affected by it are most likely not empty yet! So this
-# might only be effective in the next script run.
-if sync_mode >= 1:
-    logging.info("Deleting all empty albums")
-    albums = fetch_albums()
-    # pylint: disable=C0103
-    empty_album_count = 0
-    # pylint: disable=C0103
-    cleaned_album_count = 0
-    for album in albums:
-        if album['assetCount'] == 0:
-            empty_album_count += 1
+        # Albums are independent of each other, so perform the API calls concurrently
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+            list(executor.map(update_album_properties, album_models_to_randomize))
+
+
+    # Perform sync mode action: Trigger offline asset removal
+    if sync_mode == 2:
+        logging.info("Trigger offline asset removal")
+        trigger_offline_asset_removal()
+
+    # Perform sync mode action: Delete empty albums
+    #
+    # For Immich versions prior to v1.116.0:
+    # Offline Asset Removal is an asynchronous job, which has been waited for
+    # (up to OFFLINE_ASSET_REMOVAL_TIMEOUT seconds). If it did not finish in time,
+    # albums affected by it are not empty yet and will only be deleted in the next script run.
+    if sync_mode >= 1:
+        logging.info("Deleting all empty albums")
+        # Albums must be fetched again to get up-to-date asset counts after adding assets and removing offline assets
+        albums = fetch_albums()
+        empty_albums = [album for album in albums if album['assetCount'] == 0]
+        empty_album_count = len(empty_albums)
+        for album in empty_albums:
             logging.info("Deleting empty album %s", album['albumName'])
-            if delete_album(album):
-                cleaned_album_count += 1
-    if empty_album_count > 0:
-        logging.info("Successfully deleted %d/%d empty albums!", cleaned_album_count, empty_album_count)
-    else:
-        logging.info("No empty albums found!")
+        # Deleting albums are independent API calls, so perform them concurrently
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+            cleaned_album_count = sum(executor.map(delete_album, empty_albums))
+        if empty_album_count > 0:
+            logging.info("Successfully deleted %d/%d empty albums!", cleaned_album_count, empty_album_count)
+        else:
+            logging.info("No empty albums found!")
+
+    logging.info("Done!")
+
 
-logging.info("Done!")
+if __name__ == "__main__":
+    main()